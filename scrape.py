@@ -4,80 +4,352 @@ Crisp.nl Product Scraper - Find products on sale/cheap
 Simple web scraper to get product data from Crisp.nl
 """
 
-import requests
-from bs4 import BeautifulSoup
-import json
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import email.utils
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+import orjson
 import re
 import time
 from urllib.parse import urljoin, urlparse
 import csv
+import functools
+import importlib.util
 from datetime import datetime
 import logging
+import multiprocessing
+import os
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# httpx can only decode brotli ('br') responses when one of these is installed
+_HAS_BROTLI = any(importlib.util.find_spec(name) for name in ('brotli', 'brotlicffi'))
+# HTTP/2 needs the h2 package (httpx[http2]); fall back to HTTP/1.1 without it
+_HAS_H2 = importlib.util.find_spec('h2') is not None
+
+# Precompiled patterns used on every product/element
+_PRICE_RE = re.compile(r'(\d+(?:[,.]\d+)?)')
+_DISCOUNT_RE = re.compile(r'(\d+)%')
+# Discount percentage or sale keyword, whichever comes first
+_SALE_ALL_RE = re.compile(r'(\d+)%|korting|sale|aanbieding|actie|voordeel|nu voor|was|bespaar|nu|%', re.I)
+_EURO_PRICE_RE = re.compile(r'€\s*(\d+(?:[,.]\d+)?)')
+# JSON-LD blocks, read straight from the raw HTML without building a DOM
+_JSON_LD_RE = re.compile(
+    rb'<script\b[^>]*\stype\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.I | re.S,
+)
+
+# Compound selectors, so each lookup below is a single Lexbor traversal
+_HEADING_SELECTOR = 'h1,h2,h3,h4,h5,h6'
+_TITLE_SELECTOR = (
+    '[class*="title" i],[class*="name" i],[class*="product" i],'
+    '[data-testid*="title" i],[data-testid*="name" i]'
+)
+_PRICE_SELECTOR = '[class*="price" i],[class*="cost" i],[class*="amount" i],[data-testid*="price" i]'
+_DESC_SELECTOR = '[class*="description" i],[class*="desc" i],[class*="summary" i]'
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_price(price_text):
+    """Parse a price string, cached since listings repeat the same prices
+
+    Pages parsed in the process pool use that worker's own cache, which only
+    lasts for one scrape_all_products run.
+    """
+    # Find the first number, accepting either ',' or '.' as decimal separator
+    price_match = _PRICE_RE.search(price_text)
+    if price_match:
+        return float(price_match.group(1).replace(',', '.'))
+    return None
+
+
+def _retry_after_seconds(value):
+    """Convert a Retry-After header (seconds or HTTP date) to seconds from now"""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _rate_limit_reset_seconds(value):
+    """Convert an X-RateLimit-Reset header (delta seconds or epoch time) to seconds from now"""
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset > 1e9:  # Large values are Unix timestamps rather than a countdown
+        reset -= time.time()
+    return max(0.0, reset)
+
+
+def _extract_price(price_text):
+    """Extract numerical price from text"""
+    if not price_text:
+        return None
+    return _parse_price(price_text)
+
+
+def _find_all(element, selector):
+    """Descendants of element matching selector
+
+    Lexbor node queries also match the node itself, unlike BeautifulSoup's find_all.
+    """
+    root_id = element.mem_id
+    return [node for node in element.css(selector) if node.mem_id != root_id]
+
+
+def _find(element, selector):
+    """First descendant of element matching selector, or None"""
+    node = element.css_first(selector)
+    if node is not None and node.mem_id == element.mem_id:
+        # The element itself always comes first in document order
+        matches = element.css(selector)
+        node = matches[1] if len(matches) > 1 else None
+    return node
+
+
+def _product_from_element(element, base_url, _urljoin=urljoin):
+    """Extract product information from a selectolax node"""
+    product = {}
+    
+    try:
+        # Try to find product title, preferring headings over class/testid matches
+        title_elem = _find(element, _HEADING_SELECTOR) or _find(element, _TITLE_SELECTOR)
+        
+        if title_elem:
+            product['title'] = title_elem.text(strip=True)
+        
+        # Try to find price information
+        price_texts = [node.text(strip=True) for node in _find_all(element, _PRICE_SELECTOR)]
+        
+        extract_price = _extract_price
+        prices = []
+        for price_text in price_texts:
+            if '€' in price_text:
+                price = extract_price(price_text)
+                if price:
+                    prices.append(price)
+        
+        if not prices:
+            # No priced elements, scan all of the element's text in one pass instead
+            for price_text in _EURO_PRICE_RE.findall(element.text(separator=' ', strip=True)):
+                price = extract_price(price_text)
+                if price:
+                    prices.append(price)
+        
+        if prices:
+            if len(prices) > 1:
+                # If multiple prices, assume first is sale price, second is original
+                product['sale_price'] = min(prices)
+                product['original_price'] = max(prices)
+            else:
+                product['price'] = prices[0]
+        
+        # Try to find description
+        desc_elem = _find(element, _DESC_SELECTOR)
+        if desc_elem:
+            product['description'] = desc_elem.text(strip=True)
+        
+        # Try to find image
+        img_elem = _find(element, 'img')
+        if img_elem:
+            img_attrs = img_elem.attributes  # Builds a new dict on every access
+            src = img_attrs.get('src') or img_attrs.get('data-src')
+            if src:
+                product['image'] = _urljoin(base_url, src)
+        
+        # Try to find product link
+        link_elem = _find(element, 'a')
+        if link_elem:
+            href = link_elem.attributes.get('href')
+            if href:
+                product['link'] = _urljoin(base_url, href)
+        
+        return product if product.get('title') and (product.get('price') or product.get('sale_price')) else None
+        
+    except Exception as e:
+        logger.warning(f"Error extracting product: {e}")
+        return None
+
+
+def _json_ld_products(html, url):
+    """Extract products from the JSON-LD blocks of a raw HTML page"""
+    products = []
+    is_product_page = '/product/' in url
+    for match in _JSON_LD_RE.finditer(html):
+        script_text = match.group(1)
+        if b'"@type"' not in script_text:
+            continue  # Not something we can recognise as a Product
+        try:
+            data = orjson.loads(script_text)
+            if isinstance(data, dict) and data.get('@type') == 'Product':
+                product = {
+                    'title': data.get('name'),
+                    'description': data.get('description'),
+                    'price': _extract_price(str(data.get('offers', {}).get('price', ''))),
+                    'link': url,
+                    'source': 'json-ld'
+                }
+                if product['title'] and product['price']:
+                    products.append(product)
+                    if is_product_page:
+                        break  # A product page describes a single product
+        except (orjson.JSONDecodeError, AttributeError):
+            continue
+    
+    return products
+
+
+def parse_page(body, url, base_url):
+    """Extract products from a downloaded page
+
+    Top-level and free of scraper state so it can run in a worker process.
+    """
+    # Look for JSON-LD structured data first
+    products = _json_ld_products(body, url)
+    
+    # If no JSON-LD found, try to find product containers
+    if not products:
+        # Only now build the full DOM
+        tree = LexborHTMLParser(body)
+        
+        # Common selectors for product containers
+        product_selectors = [
+            '[class*="product"]',
+            '[class*="item"]',
+            '[data-testid*="product"]',
+            'article',
+            '.card',
+            '[class*="tile"]'
+        ]
+        
+        for selector in product_selectors:
+            elements = tree.css(selector)
+            if elements:
+                logger.info(f"Found {len(elements)} elements with selector: {selector}")
+                for element in elements[:10]:  # Limit to prevent overwhelming
+                    product = _product_from_element(element, base_url)
+                    if product:
+                        products.append(product)
+                
+                if products:  # If we found products, don't try other selectors
+                    break
+    
+    return products
+
+
 class CrispScraper:
     def __init__(self):
         self.base_url = "https://crisp.nl"
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'nl-NL,nl;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate, br' if _HAS_BROTLI else 'gzip, deflate',
             'Upgrade-Insecure-Requests': '1',
-        })
+        }
+        self.max_concurrency = 8  # Pages fetched at the same time
+        self.requests_per_second = 1.0  # Per host
+        self._buckets = {}  # host -> (tokens, last refill time)
+        self.rate_limit_wait = 30.0  # Seconds to back off when a host gives no reset time
+        self.session = None  # httpx.AsyncClient, opened by the first get_page call
+        self._executor = None  # Page parsing pool; None uses the default thread pool
         self.products = []
+        self._sale_products_cache = None  # Result of find_sale_products for self.products
+        
+    def _new_session(self):
+        """Create the pooled HTTP/2 client shared by all get_page calls"""
+        return httpx.AsyncClient(
+            http2=_HAS_H2,
+            headers=self.headers,
+            timeout=10.0,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=20),
+        )
         
-    def get_page(self, url, retries=3):
+    async def _acquire(self, host):
+        """Wait until the token bucket for a host allows another request"""
+        rate = self.requests_per_second
+        capacity = max(1.0, rate)
+        while True:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(host, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[host] = (tokens - 1, now)
+                return
+            self._buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / rate)
+    
+    def _throttle(self, host, response):
+        """Hold back a host whose response asks us to slow down"""
+        delay = None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            delay = _retry_after_seconds(retry_after)
+        elif response.headers.get('X-RateLimit-Remaining') == '0':
+            delay = _rate_limit_reset_seconds(response.headers.get('X-RateLimit-Reset'))
+            if delay is None:
+                delay = self.rate_limit_wait
+        
+        if delay is not None:
+            # Empty the bucket; a refill time in the future makes _acquire wait it out
+            self._buckets[host] = (0.0, time.monotonic() + delay)
+        
+    async def close_session(self):
+        """Close the HTTP client opened by get_page, if any"""
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.aclose()
+        
+    async def get_page(self, url, retries=3):
         """Get a page with retry logic"""
+        if self.session is None:
+            # The client belongs to the running event loop; close_session releases it
+            self.session = self._new_session()
+        host = urlparse(url).netloc
         for attempt in range(retries):
+            await self._acquire(host)
             try:
-                response = self.session.get(url, timeout=10)
+                response = await self.session.get(url)
+                self._throttle(host, response)
                 response.raise_for_status()
                 return response
-            except requests.RequestException as e:
+            except httpx.HTTPError as e:
                 logger.warning(f"Attempt {attempt + 1} failed for {url}: {e}")
                 if attempt < retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
                 else:
                     logger.error(f"Failed to fetch {url} after {retries} attempts")
                     return None
     
     def extract_price(self, price_text):
         """Extract numerical price from text"""
-        if not price_text:
-            return None
-        
-        # Remove currency symbols and find numbers
-        price_match = re.search(r'(\d+[,.]?\d*)', price_text.replace('€', '').replace(',', '.'))
-        if price_match:
-            return float(price_match.group(1))
-        return None
+        return _extract_price(price_text)
     
     def is_on_sale(self, product):
         """Determine if a product is on sale based on various indicators"""
-        text_lower = (product.get('title', '') + ' ' + product.get('description', '')).lower()
+        text = f"{product.get('title') or ''} {product.get('description') or ''}"
         
-        # Sale indicators
-        sale_keywords = [
-            'korting', 'sale', 'aanbieding', 'actie', 'voordeel', 
-            'nu voor', 'was', 'bespaar', 'nu', '%'
-        ]
-        
-        # Check for discount percentage
-        discount_match = re.search(r'(\d+)%', text_lower)
-        if discount_match:
-            product['discount_percentage'] = int(discount_match.group(1))
+        # Check for a discount percentage or sale keywords in one pass
+        sale_match = _SALE_ALL_RE.search(text)
+        if sale_match:
+            discount = sale_match.group(1)
+            if discount is None:
+                # A keyword came first; any discount can only appear after it
+                discount_match = _DISCOUNT_RE.search(text, sale_match.end())
+                discount = discount_match and discount_match.group(1)
+            if discount:
+                product['discount_percentage'] = int(discount)
             return True
-            
-        # Check for sale keywords
-        for keyword in sale_keywords:
-            if keyword in text_lower:
-                return True
                 
         # Check if there are both original and sale prices
         if product.get('original_price') and product.get('sale_price'):
@@ -86,179 +358,102 @@ class CrispScraper:
         return False
     
     def scrape_product_from_element(self, element):
-        """Extract product information from a BeautifulSoup element"""
-        product = {}
-        
-        try:
-            # Try to find product title
-            title_elem = element.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) or \
-                        element.find(class_=re.compile(r'title|name|product', re.I)) or \
-                        element.find(attrs={'data-testid': re.compile(r'title|name', re.I)})
-            
-            if title_elem:
-                product['title'] = title_elem.get_text(strip=True)
-            
-            # Try to find price information
-            price_elements = element.find_all(class_=re.compile(r'price|cost|amount', re.I)) + \
-                           element.find_all(attrs={'data-testid': re.compile(r'price', re.I)}) + \
-                           element.find_all(text=re.compile(r'€\s*\d+'))
-            
-            prices = []
-            for price_elem in price_elements:
-                if hasattr(price_elem, 'get_text'):
-                    price_text = price_elem.get_text(strip=True)
-                else:
-                    price_text = str(price_elem).strip()
-                
-                if '€' in price_text:
-                    price = self.extract_price(price_text)
-                    if price:
-                        prices.append(price)
-            
-            if prices:
-                if len(prices) > 1:
-                    # If multiple prices, assume first is sale price, second is original
-                    product['sale_price'] = min(prices)
-                    product['original_price'] = max(prices)
-                else:
-                    product['price'] = prices[0]
-            
-            # Try to find description
-            desc_elem = element.find(class_=re.compile(r'description|desc|summary', re.I))
-            if desc_elem:
-                product['description'] = desc_elem.get_text(strip=True)
-            
-            # Try to find image
-            img_elem = element.find('img')
-            if img_elem:
-                src = img_elem.get('src') or img_elem.get('data-src')
-                if src:
-                    product['image'] = urljoin(self.base_url, src)
-            
-            # Try to find product link
-            link_elem = element.find('a')
-            if link_elem and link_elem.get('href'):
-                product['link'] = urljoin(self.base_url, link_elem['href'])
-            
-            return product if product.get('title') and (product.get('price') or product.get('sale_price')) else None
-            
-        except Exception as e:
-            logger.warning(f"Error extracting product: {e}")
-            return None
+        """Extract product information from a selectolax node"""
+        return _product_from_element(element, self.base_url)
+    
+    async def fetch_page(self, url):
+        """Download a page and return its raw body, or None on failure"""
+        response = await self.get_page(url)
+        return response.content if response else None
     
-    def scrape_products_page(self, url):
+    async def scrape_products_page(self, url):
         """Scrape products from a specific page"""
         logger.info(f"Scraping: {url}")
-        response = self.get_page(url)
+        body = await self.fetch_page(url)
         
-        if not response:
+        if not body:
             return []
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        products = []
-        
-        # Look for JSON-LD structured data first
-        json_scripts = soup.find_all('script', type='application/ld+json')
-        for script in json_scripts:
-            try:
-                data = json.loads(script.string)
-                if isinstance(data, dict) and data.get('@type') == 'Product':
-                    product = {
-                        'title': data.get('name'),
-                        'description': data.get('description'),
-                        'price': self.extract_price(str(data.get('offers', {}).get('price', ''))),
-                        'link': url,
-                        'source': 'json-ld'
-                    }
-                    if product['title'] and product['price']:
-                        products.append(product)
-            except (json.JSONDecodeError, AttributeError):
-                continue
-        
-        # If no JSON-LD found, try to find product containers
-        if not products:
-            # Common selectors for product containers
-            product_selectors = [
-                '[class*="product"]',
-                '[class*="item"]',
-                '[data-testid*="product"]',
-                'article',
-                '.card',
-                '[class*="tile"]'
-            ]
-            
-            for selector in product_selectors:
-                elements = soup.select(selector)
-                if elements:
-                    logger.info(f"Found {len(elements)} elements with selector: {selector}")
-                    for element in elements[:10]:  # Limit to prevent overwhelming
-                        product = self.scrape_product_from_element(element)
-                        if product:
-                            products.append(product)
-                    
-                    if products:  # If we found products, don't try other selectors
-                        break
-        
-        return products
+        # Parse off the event loop, in the process pool while scraping
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, parse_page, body, url, self.base_url)
     
-    def find_product_pages(self):
+    async def find_product_pages(self):
         """Find product listing pages"""
-        urls_to_scrape = [
+        # Dict keys keep discovery order and make the duplicate check O(1)
+        urls_to_scrape = dict.fromkeys([
             f"{self.base_url}/onze-producten",
             f"{self.base_url}/",
-        ]
+        ])
         
         # Try to find category pages
         try:
-            response = self.get_page(f"{self.base_url}/onze-producten")
-            if response:
-                soup = BeautifulSoup(response.text, 'html.parser')
+            body = await self.fetch_page(f"{self.base_url}/onze-producten")
+            if body:
+                tree = LexborHTMLParser(body)
                 
                 # Look for category links
-                links = soup.find_all('a', href=True)
-                for link in links:
-                    href = link['href']
-                    if any(keyword in href.lower() for keyword in ['product', 'categorie', 'category']):
-                        full_url = urljoin(self.base_url, href)
-                        if full_url not in urls_to_scrape:
-                            urls_to_scrape.append(full_url)
+                links = tree.css('a[href*="product" i],a[href*="categorie" i],a[href*="category" i]')
+                urls_to_scrape.update(dict.fromkeys(
+                    urljoin(self.base_url, link.attributes['href']) for link in links
+                ))
                             
         except Exception as e:
             logger.warning(f"Error finding category pages: {e}")
         
-        return urls_to_scrape[:5]  # Limit to first 5 to be respectful
+        return list(urls_to_scrape)[:5]  # Limit to first 5 to be respectful
     
     def scrape_all_products(self):
         """Main scraping function"""
+        return asyncio.run(self._scrape_all_products())
+    
+    async def _scrape_all_products(self):
+        """Scrape all product pages concurrently"""
         logger.info("Starting Crisp.nl product scraping...")
         
-        urls = self.find_product_pages()
-        logger.info(f"Found {len(urls)} URLs to scrape")
-        
-        all_products = []
-        
-        for url in urls:
-            products = self.scrape_products_page(url)
-            all_products.extend(products)
+        try:
+            urls = await self.find_product_pages()
+            logger.info(f"Found {len(urls)} URLs to scrape")
+            
+            semaphore = asyncio.Semaphore(self.max_concurrency)
             
-            # Be respectful - add delay between requests
-            time.sleep(1)
+            async def scrape(url):
+                # Be respectful - get_page rate limits each host
+                async with semaphore:
+                    return await self.scrape_products_page(url)
+            
+            # Spawn, not fork: this process already has threads (DNS lookups run in the default pool)
+            with ProcessPoolExecutor(
+                max_workers=min(len(urls), os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context('spawn'),
+            ) as executor:
+                self._executor = executor
+                try:
+                    results = await asyncio.gather(*(scrape(url) for url in urls))
+                finally:
+                    self._executor = None
+        finally:
+            # asyncio.run closes this loop, so the client cannot outlive the run
+            await self.close_session()
+        
+        all_products = [product for products in results for product in products]
         
-        # Remove duplicates based on title
-        seen_titles = set()
-        unique_products = []
+        # Remove duplicates based on title, keeping the first occurrence
+        unique_products = {}
         for product in all_products:
-            if product['title'] not in seen_titles:
-                seen_titles.add(product['title'])
-                unique_products.append(product)
+            unique_products.setdefault(product['title'], product)
         
-        self.products = unique_products
+        self.products = list(unique_products.values())
+        self._sale_products_cache = None
         logger.info(f"Found {len(self.products)} unique products")
         
         return self.products
     
     def find_sale_products(self):
         """Filter products that are on sale or cheap"""
+        if self._sale_products_cache is not None:
+            return self._sale_products_cache
+        
         if not self.products:
             self.scrape_all_products()
         
@@ -270,8 +465,9 @@ class CrispScraper:
                 sale_products.append(product)
         
         # Sort by discount percentage if available, otherwise by price
-        sale_products.sort(key=lambda x: (-x.get('discount_percentage', 0), x.get('price', x.get('sale_price', 999))))
+        sale_products.sort(key=lambda x: (-(x.get('discount_percentage') or 0), x.get('price') or x.get('sale_price') or 999))
         
+        self._sale_products_cache = sale_products
         return sale_products
     
     def save_to_csv(self, products, filename=None):
@@ -287,21 +483,19 @@ class CrispScraper:
         fieldnames = ['title', 'price', 'sale_price', 'original_price', 'discount_percentage', 
                      'description', 'link', 'image', 'on_sale', 'source']
         
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        with open(filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
+            # Missing fields are written as '' (restval), unknown ones are skipped
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
             writer.writeheader()
-            
-            for product in products:
-                # Fill in missing fields
-                row = {field: product.get(field, '') for field in fieldnames}
-                writer.writerow(row)
+            writer.writerows(products)
         
         logger.info(f"Saved {len(products)} products to {filename}")
         return filename
     
-    def print_sale_products(self, limit=20):
+    def print_sale_products(self, limit=20, sale_products=None):
         """Print sale products to console"""
-        sale_products = self.find_sale_products()
+        if sale_products is None:
+            sale_products = self.find_sale_products()
         
         if not sale_products:
             print("❌ No products on sale found!")
@@ -348,10 +542,10 @@ def main():
             print(f"📊 All products saved to: {csv_file}")
             
             # Show sale products
-            scraper.print_sale_products()
+            sale_products = scraper.find_sale_products()
+            scraper.print_sale_products(sale_products=sale_products)
             
             # Save sale products separately
-            sale_products = scraper.find_sale_products()
             if sale_products:
                 sale_csv = scraper.save_to_csv(sale_products, f"crisp_sale_products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
                 print(f"🏷️  Sale products saved to: {sale_csv}")
@@ -0,0 +1,21 @@
+import pytest
+
+from scrape import CrispScraper
+
+
+@pytest.mark.parametrize('product, on_sale, discount', [
+    ({'title': '20% korting', 'description': ''}, True, 20),
+    ({'title': 'Kaas korting 20%', 'description': ''}, True, 20),
+    ({'title': 'Kaas', 'description': 'korting, nu 15% extra'}, True, 15),
+    ({'title': 'nu 5 %', 'description': ''}, True, None),
+    ({'title': 'Kaas', 'description': '0% suiker'}, True, 0),
+    ({'title': None, 'description': 'Sale'}, True, None),
+    ({'title': '25% KORTING', 'description': None}, True, 25),
+    ({'title': 'Boerenkaas'}, False, None),
+    ({'title': 'Aanbieding', 'description': ''}, True, None),
+    ({'title': 'Boerenkaas', 'description': 'Romig en vol'}, False, None),
+    ({'title': 'Boerenkaas', 'sale_price': 3.99, 'original_price': 4.99}, True, None),
+])
+def test_is_on_sale(product, on_sale, discount):
+    assert CrispScraper().is_on_sale(product) is on_sale
+    assert product.get('discount_percentage') == discount
@@ -0,0 +1,46 @@
+from scrape import parse_page
+
+BASE_URL = "https://crisp.nl"
+
+
+def test_container_class_does_not_match_itself():
+    # The container's own class contains "product", "price" and "desc"; only
+    # its descendants may be used, as with BeautifulSoup's find/find_all
+    html = (
+        '<div class="product-tile price-card desc">'
+        '<h3>Item 0</h3>'
+        '<div class="price-box">€ 0,49 € 9,99</div>'
+        '</div>'
+    ).encode()
+
+    products = parse_page(html, f"{BASE_URL}/onze-producten", BASE_URL)
+
+    assert len(products) == 1
+    assert products[0]['title'] == 'Item 0'
+    assert products[0]['price'] == 0.49
+    assert 'description' not in products[0]
+
+
+def test_heading_is_preferred_as_title():
+    html = (
+        '<article>'
+        '<span class="brand-name">Crisp</span>'
+        '<h2>Boerenkaas</h2>'
+        '<span class="price">€ 4,99</span>'
+        '</article>'
+    ).encode()
+
+    products = parse_page(html, f"{BASE_URL}/onze-producten", BASE_URL)
+
+    assert [product['title'] for product in products] == ['Boerenkaas']
+
+
+def test_json_ld_requires_a_real_type_attribute():
+    json_ld = '{"@type": "Product", "name": "Kaas", "offers": {"price": "4.99"}}'
+    url = f"{BASE_URL}/product/kaas"
+
+    html = f'<script type="application/ld+json">{json_ld}</script>'.encode()
+    assert parse_page(html, url, BASE_URL)[0]['source'] == 'json-ld'
+
+    html = f'<script data-type="application/ld+json">{json_ld}</script>'.encode()
+    assert parse_page(html, url, BASE_URL) == []
@@ -0,0 +1,87 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+
+import scrape
+from scrape import CrispScraper, _rate_limit_reset_seconds, _retry_after_seconds
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the scraper sleeps"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scrape.time, 'monotonic', fake.monotonic)
+    monkeypatch.setattr(scrape.asyncio, 'sleep', fake.sleep)
+    return fake
+
+
+def test_retry_after_seconds():
+    assert _retry_after_seconds('120') == 120.0
+    assert _retry_after_seconds('-3') == 0.0
+    http_date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert _retry_after_seconds(http_date) == pytest.approx(60, abs=2)
+    assert _retry_after_seconds('soon') is None
+
+
+def test_rate_limit_reset_seconds():
+    assert _rate_limit_reset_seconds('30') == 30.0
+    assert _rate_limit_reset_seconds(str(time.time() + 45)) == pytest.approx(45, abs=2)
+    assert _rate_limit_reset_seconds(str(time.time() - 45)) == 0.0
+    assert _rate_limit_reset_seconds(None) is None
+    assert _rate_limit_reset_seconds('abc') is None
+
+
+def test_exhausted_rate_limit_without_reset_uses_fallback_wait(clock):
+    scraper = CrispScraper()
+    scraper._throttle('crisp.nl', httpx.Response(200, headers={'X-RateLimit-Remaining': '0'}))
+
+    assert scraper._buckets['crisp.nl'] == (0.0, clock.now + scraper.rate_limit_wait)
+
+
+def test_successful_response_leaves_bucket_alone(clock):
+    scraper = CrispScraper()
+    scraper._throttle('crisp.nl', httpx.Response(200, headers={'X-RateLimit-Remaining': '5'}))
+
+    assert scraper._buckets == {}
+
+
+@pytest.mark.parametrize('rate', [1.0, 2.0])
+def test_acquire_waits_out_the_throttle_delay(clock, rate):
+    scraper = CrispScraper()
+    scraper.requests_per_second = rate
+    scraper._throttle('crisp.nl', httpx.Response(429, headers={'Retry-After': '5'}))
+
+    asyncio.run(scraper._acquire('crisp.nl'))
+
+    assert clock.slept == pytest.approx(5 + 1 / rate)
+
+
+def test_acquire_spaces_requests_per_host(clock):
+    scraper = CrispScraper()
+
+    async def acquire_all():
+        await scraper._acquire('crisp.nl')
+        await scraper._acquire('crisp.nl')
+        await scraper._acquire('example.com')
+
+    asyncio.run(acquire_all())
+
+    # The first request per host is free, the second waits one token
+    assert clock.slept == pytest.approx(1 / scraper.requests_per_second)